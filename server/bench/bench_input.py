@@ -0,0 +1,518 @@
+"""
+Xbox Web Controller — Input Path Microbenchmarks
+Times each stage of the server input path in-process, with a stand-in gamepad
+backend and no network, so hot-path changes can be judged on numbers.
+
+Usage (from the repo root, with server/requirements.txt installed):
+    python server/bench/bench_input.py                   # run and compare to baseline
+    python server/bench/bench_input.py --save-baseline   # record a new baseline
+
+Stages mirror the steps of handle_input() in server_cli.py; keep them in sync
+when the handler changes. The two handle_input rows call the real handler.
+
+Numbers are only comparable on the same machine and with the same --frames,
+--repeat and --seed: record a baseline before the change, then run again after
+it. Exit code 1 means a stage regressed, 2 that the settings do not match.
+"""
+
+import argparse, ctypes, enum, gc, json, math, os, platform, random, statistics, sys, time, tracemalloc, types
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SERVER_DIR = os.path.dirname(HERE)
+DEFAULT_BASELINE = os.path.join(HERE, 'baseline.json')
+
+sys.path.insert(0, SERVER_DIR)
+import input_guard
+
+# ── Stand-in gamepad backend ──────────────────────────────────────────────────
+# Same Python-side work as vgamepad 0.1.0's VX360Gamepad (IntFlag buttons,
+# ctypes report, round() float scaling); the driver call in update() is a no-op.
+
+class XUSB_BUTTON(enum.IntFlag):
+    XUSB_GAMEPAD_DPAD_UP = 0x0001
+    XUSB_GAMEPAD_DPAD_DOWN = 0x0002
+    XUSB_GAMEPAD_DPAD_LEFT = 0x0004
+    XUSB_GAMEPAD_DPAD_RIGHT = 0x0008
+    XUSB_GAMEPAD_START = 0x0010
+    XUSB_GAMEPAD_BACK = 0x0020
+    XUSB_GAMEPAD_LEFT_THUMB = 0x0040
+    XUSB_GAMEPAD_RIGHT_THUMB = 0x0080
+    XUSB_GAMEPAD_LEFT_SHOULDER = 0x0100
+    XUSB_GAMEPAD_RIGHT_SHOULDER = 0x0200
+    XUSB_GAMEPAD_GUIDE = 0x0400
+    XUSB_GAMEPAD_A = 0x1000
+    XUSB_GAMEPAD_B = 0x2000
+    XUSB_GAMEPAD_X = 0x4000
+    XUSB_GAMEPAD_Y = 0x8000
+
+
+class XUSB_REPORT(ctypes.Structure):
+    _fields_ = [("wButtons", ctypes.c_ushort),
+                ("bLeftTrigger", ctypes.c_byte),
+                ("bRightTrigger", ctypes.c_byte),
+                ("sThumbLX", ctypes.c_short),
+                ("sThumbLY", ctypes.c_short),
+                ("sThumbRX", ctypes.c_short),
+                ("sThumbRY", ctypes.c_short)]
+
+
+def _driver_update(busp, devicep, report):
+    """Stands in for vigem_target_x360_update(); always succeeds."""
+    return 0
+
+
+def _check_err(err):
+    if err != 0:
+        raise Exception(err)
+
+
+class StandInGamepad:
+    def __init__(self):
+        self._busp = object()
+        self._devicep = object()
+        self.report = XUSB_REPORT()
+        self.update()
+
+    def reset(self):
+        self.report = XUSB_REPORT()
+
+    def press_button(self, button):
+        self.report.wButtons = self.report.wButtons | button
+
+    def release_button(self, button):
+        self.report.wButtons = self.report.wButtons & ~button
+
+    def left_trigger(self, value):
+        self.report.bLeftTrigger = value
+
+    def right_trigger(self, value):
+        self.report.bRightTrigger = value
+
+    def left_trigger_float(self, value_float):
+        self.left_trigger(round(value_float * 255))
+
+    def right_trigger_float(self, value_float):
+        self.right_trigger(round(value_float * 255))
+
+    def left_joystick(self, x_value, y_value):
+        self.report.sThumbLX = x_value
+        self.report.sThumbLY = y_value
+
+    def right_joystick(self, x_value, y_value):
+        self.report.sThumbRX = x_value
+        self.report.sThumbRY = y_value
+
+    def left_joystick_float(self, x_value_float, y_value_float):
+        self.left_joystick(round(x_value_float * 32767), round(y_value_float * 32767))
+
+    def right_joystick_float(self, x_value_float, y_value_float):
+        self.right_joystick(round(x_value_float * 32767), round(y_value_float * 32767))
+
+    def update(self):
+        _check_err(_driver_update(self._busp, self._devicep, self.report))
+
+
+def load_server():
+    """Import server_cli.py against the stand-in backend."""
+    vg = types.ModuleType('vgamepad')
+    vg.XUSB_BUTTON = XUSB_BUTTON
+    vg.VX360Gamepad = StandInGamepad
+    sys.modules['vgamepad'] = vg
+    import server_cli
+    return server_cli
+
+
+# ── Payload mixes ─────────────────────────────────────────────────────────────
+# Each mix is a list of controller states (ls.x, ls.y, rs.x, rs.y, lt, rt, bits)
+# encoded both as the binary frame and as the legacy JSON dict.
+
+def mix_idle(n, rng):
+    return [(0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0)] * n
+
+
+def mix_stick_sweep(n, rng):
+    states = []
+    for i in range(n):
+        a = 2 * math.pi * i / 120
+        states.append((math.cos(a), math.sin(a), math.cos(-a) * 0.5, math.sin(-a) * 0.5,
+                       (i % 60) / 59, 0.0, 0))
+    return states
+
+
+def mix_button_mash(n, rng):
+    return [(0.0, 0.0, 0.0, 0.0, float(rng.random() < 0.5), float(rng.random() < 0.5),
+             rng.getrandbits(15)) for _ in range(n)]
+
+
+def encode_binary(server, states):
+    pack = input_guard.FRAME_FORMAT.pack
+    return [pack(lsx, lsy, rsx, rsy, lt, rt, bits)
+            for lsx, lsy, rsx, rsy, lt, rt, bits in states]
+
+
+def encode_legacy(server, states):
+    return [{'ls': {'x': lsx, 'y': lsy}, 'rs': {'x': rsx, 'y': rsy}, 'lt': lt, 'rt': rt,
+             'buttons': {btn: bool(bits & (1 << i)) for i, btn in enumerate(input_guard.BUTTON_ORDER)}}
+            for lsx, lsy, rsx, rsy, lt, rt, bits in states]
+
+
+def malformed_payloads(server, n, rng):
+    size = input_guard.FRAME_FORMAT.size
+    samples = [
+        b'', b'\x00' * (size - 1), b'\x00' * (size + 1), b'\xff' * 4096,
+        input_guard.FRAME_FORMAT.pack(float('nan'), 0, 0, 0, 0, 0, 0),
+        input_guard.FRAME_FORMAT.pack(0, 0, float('inf'), 0, 0, 0, 0),
+        input_guard.FRAME_FORMAT.pack(0, 0, 0, 0, 0, float('-inf'), 0),
+        input_guard.FRAME_FORMAT.pack(0, 0, 0, 0, 0, 0, float('inf')),
+        # Out of range: clamped, not rejected
+        input_guard.FRAME_FORMAT.pack(5.0, -5.0, 1e30, 0, 2.0, -1.0, 1e30),
+        None, 42, 'input', [0.0] * 7,
+        {'ls': 'x', 'rs': None, 'lt': 'abc', 'rt': [], 'buttons': 7},
+        {'ls': {'x': 'inf', 'y': '-inf'}, 'lt': 'nan', 'rt': 1e308 * 10},
+        {'ls': {'x': 5.0, 'y': -5.0}, 'rs': {'x': 1e30}, 'lt': 2.0, 'rt': -1.0},
+        {str(i): i for i in range(64)},
+        {'buttons': {str(i): True for i in range(64)}},
+    ]
+    return [samples[rng.randrange(len(samples))] for _ in range(n)]
+
+
+# ── Stages ────────────────────────────────────────────────────────────────────
+# Every stage is fn(ctx) that processes all of ctx's frames once.
+
+def stage_loop(ctx):
+    for data in ctx['binary']:
+        pass
+
+
+def stage_rate_limit(ctx):
+    submit = ctx['gate'].submit
+    for data in ctx['binary']:
+        submit('bench', data)
+
+
+def stage_decode(ctx):
+    payload_ok = input_guard.payload_ok
+    decode_frame = input_guard.decode_frame
+    for data in ctx['binary']:
+        if payload_ok(data) and type(data) is bytes:
+            decode_frame(data)
+
+
+def stage_decode_legacy(ctx):
+    payload_ok = input_guard.payload_ok
+    clamp_axis, clamp_trigger = input_guard.clamp_axis, input_guard.clamp_trigger
+    for data in ctx['legacy']:
+        if not payload_ok(data) or type(data) is not dict:
+            continue
+        try:
+            ls = data.get('ls', {})
+            rs = data.get('rs', {})
+            if not isinstance(ls, dict): ls = {}
+            if not isinstance(rs, dict): rs = {}
+            clamp_axis(float(ls.get('x', 0))); clamp_axis(float(ls.get('y', 0)))
+            clamp_axis(float(rs.get('x', 0))); clamp_axis(float(rs.get('y', 0)))
+            clamp_trigger(float(data.get('lt', 0))); clamp_trigger(float(data.get('rt', 0)))
+        except (ValueError, TypeError, AttributeError, OverflowError):
+            pass
+
+
+def stage_buttons(ctx):
+    gp = ctx['gp']
+    bits_table = ctx['server'].BUTTON_BITS
+    for bits in ctx['bits']:
+        for mask, button in bits_table:
+            if bits & mask:
+                gp.press_button(button=button)
+            else:
+                gp.release_button(button=button)
+
+
+def stage_buttons_legacy(ctx):
+    gp = ctx['gp']
+    button_map = ctx['server'].BUTTON_MAP
+    for buttons in ctx['button_dicts']:
+        for btn_id, pressed in buttons.items():
+            if btn_id in button_map:
+                if pressed:
+                    gp.press_button(button=button_map[btn_id])
+                else:
+                    gp.release_button(button=button_map[btn_id])
+
+
+def stage_analog(ctx):
+    gp = ctx['gp']
+    for lsx, lsy, rsx, rsy, lt, rt in ctx['analog']:
+        gp.left_joystick_float(x_value_float=lsx, y_value_float=-lsy)
+        gp.right_joystick_float(x_value_float=rsx, y_value_float=-rsy)
+        gp.left_trigger_float(value_float=lt)
+        gp.right_trigger_float(value_float=rt)
+
+
+def stage_update(ctx):
+    update = ctx['gp'].update
+    for data in ctx['binary']:
+        update()
+
+
+def stage_handle_input(ctx):
+    handle_input = ctx['server'].handle_input
+    for data in ctx['binary']:
+        handle_input(data)
+
+
+def stage_handle_input_legacy(ctx):
+    handle_input = ctx['server'].handle_input
+    for data in ctx['legacy']:
+        handle_input(data)
+
+
+# (name, fn, runs on malformed mix)
+STAGES = [
+    ('rate_limit',          stage_rate_limit,          True),
+    ('decode',              stage_decode,              True),
+    ('decode_legacy',       stage_decode_legacy,       True),
+    ('buttons',             stage_buttons,             False),
+    ('buttons_legacy',      stage_buttons_legacy,      False),
+    ('analog',              stage_analog,              False),
+    ('update',              stage_update,              False),
+    ('handle_input',        stage_handle_input,        True),
+    ('handle_input_legacy', stage_handle_input_legacy, True),
+]
+
+
+def build_contexts(server, gp, gate, frames, seed):
+    rng = random.Random(seed)
+    contexts = {}
+    for name, make in (('idle', mix_idle), ('stick_sweep', mix_stick_sweep),
+                       ('button_mash', mix_button_mash)):
+        states = make(frames, rng)
+        legacy = encode_legacy(server, states)
+        contexts[name] = {
+            'binary': encode_binary(server, states),
+            'legacy': legacy,
+            'analog': [s[:6] for s in states],
+            'bits': [s[6] for s in states],
+            'button_dicts': [d['buttons'] for d in legacy],
+        }
+    bad = malformed_payloads(server, frames, rng)
+    contexts['malformed'] = {'binary': bad, 'legacy': bad}
+    for ctx in contexts.values():
+        ctx.update(server=server, gp=gp, gate=gate)
+    return contexts
+
+
+# ── Measurement ───────────────────────────────────────────────────────────────
+
+def time_stages(jobs, repeat):
+    """Median ns per frame for each (key, fn, ctx) job.
+
+    Runs are interleaved, every job once per round for `repeat` rounds, so a
+    slow spell on the machine hits one run of many stages rather than every
+    run of one stage, and the median discards it.
+    """
+    runs = {key: [] for key, fn, ctx in jobs}
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for key, fn, ctx in jobs:
+            fn(ctx)  # warm up
+        for _ in range(repeat):
+            for key, fn, ctx in jobs:
+                start = time.perf_counter_ns()
+                fn(ctx)
+                runs[key].append(time.perf_counter_ns() - start)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return {key: statistics.median(runs[key]) / len(ctx['binary']) for key, fn, ctx in jobs}
+
+
+def alloc_stage(fn, ctx, sample=64):
+    """Average bytes a single frame allocates, measured with tracemalloc.
+
+    For each sampled frame this is the peak of traced memory above the level
+    before the call, so memory allocated and released within the frame counts
+    too. CPython has no cumulative allocation counter, so several short-lived
+    objects that never coexist count only once. It includes the harness's own
+    per-call cost; run() subtracts stage_loop's figure, as with loop_ns.
+    """
+    keys = [key for key in ('binary', 'legacy', 'analog', 'bits', 'button_dicts') if key in ctx]
+    count = min(sample, len(ctx['binary']))
+    one_frame = []
+    for i in range(count):
+        one = dict(ctx)
+        for key in keys:
+            one[key] = ctx[key][i:i + 1]
+        one_frame.append(one)
+
+    fn(ctx)  # warm up caches and free lists
+    tracemalloc.start()
+    try:
+        total = sum(_traced_peak(fn, one) for one in one_frame)
+    finally:
+        tracemalloc.stop()
+    return total / count
+
+
+def _traced_peak(fn, ctx):
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    fn(ctx)
+    return tracemalloc.get_traced_memory()[1] - before
+
+
+def check_coalescing(server, timeout=1.0):
+    """A burst of more than INPUT_BURST frames must still end on the last state.
+
+    Sends twice the burst of "A + LT held" frames and then one release through
+    the real handler at the default rate limit; the release is over budget and
+    has to be applied by the gate's flusher.
+    """
+    from flask import request
+
+    sid = 'burst'
+    gp = StandInGamepad()
+    server.gamepads[sid] = gp
+    server.input_gate.open(sid)
+    held = input_guard.FRAME_FORMAT.pack(0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 1)
+    released = input_guard.FRAME_FORMAT.pack(0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0)
+    try:
+        with server.app.test_request_context():
+            request.sid = sid
+            for _ in range(2 * input_guard.INPUT_BURST):
+                server.handle_input(held)
+            server.handle_input(released)
+        deadline = time.monotonic() + timeout
+        while (gp.report.wButtons or gp.report.bLeftTrigger) and time.monotonic() < deadline:
+            time.sleep(0.001)
+        return gp.report.wButtons == 0 and gp.report.bLeftTrigger == 0
+    finally:
+        server.input_gate.close(sid)
+        server.gamepads.pop(sid, None)
+
+
+def run(frames, repeat, seed):
+    server = load_server()
+    from flask import request
+
+    if not check_coalescing(server):
+        raise SystemExit("FAIL: a burst over INPUT_BURST did not end on the last state sent")
+
+    sid = 'bench'
+    gp = StandInGamepad()
+    # Effectively unlimited, so every frame takes the apply-now path and the
+    # handler rows measure the full path
+    server.input_gate.rate = server.input_gate.burst = 1e12
+    server.input_gate.open(sid)
+    server.gamepads[sid] = gp
+    gate = input_guard.InputGate(lambda sid, data: None, rate=1e12, burst=1e12)
+    gate.open(sid)
+
+    contexts = build_contexts(server, gp, gate, frames, seed)
+    jobs = []
+    for mix, ctx in contexts.items():
+        jobs.append((f'loop/{mix}', stage_loop, ctx))
+        for name, fn, on_malformed in STAGES:
+            if mix != 'malformed' or on_malformed:
+                jobs.append((f'{name}/{mix}', fn, ctx))
+
+    results = {}
+    with server.app.test_request_context():
+        request.sid = sid
+        timings = time_stages(jobs, repeat)
+        loop_bytes = {mix: alloc_stage(stage_loop, ctx) for mix, ctx in contexts.items()}
+        for key, fn, ctx in jobs:
+            if fn is stage_loop:
+                continue
+            mix = key.split('/')[1]
+            results[key] = {
+                'ns_per_frame': round(max(0.0, timings[key] - timings[f'loop/{mix}']), 1),
+                'alloc_bytes_per_frame': round(max(0.0, alloc_stage(fn, ctx) - loop_bytes[mix]), 1),
+            }
+    return results
+
+
+# ── Reporting ─────────────────────────────────────────────────────────────────
+
+def report(results, baseline, threshold, min_delta):
+    """Print the results table; return the keys that regressed past threshold.
+
+    Ratios are divided by the median ratio over all stages, so a machine that
+    is busier or slower than when the baseline was recorded does not flag
+    every stage; a change to one stage moves too few rows to shift it. A stage
+    only counts as a regression if it is both `threshold` times and
+    `min_delta` ns/frame slower, so the ratio of two tiny, noisy numbers cannot
+    fail the run on its own.
+    """
+    regressions = []
+    ratios = [res['ns_per_frame'] / baseline[key]['ns_per_frame'] for key, res in results.items()
+              if baseline.get(key) and baseline[key]['ns_per_frame'] > 0]
+    speed = statistics.median(ratios) if ratios else 1.0
+    if ratios:
+        print(f"median ratio vs baseline: {speed:.2f}x (ratios below are scaled by it)\n")
+    print(f"{'stage/mix':<34}{'ns/frame':>11}{'B/frame':>10}{'baseline':>11}{'ratio':>8}")
+    print('-' * 74)
+    for key, res in results.items():
+        ns = res['ns_per_frame']
+        line = f"{key:<34}{ns:>11.1f}{res['alloc_bytes_per_frame']:>10.1f}"
+        base = baseline.get(key)
+        if base and base['ns_per_frame'] > 0:
+            ratio = ns / base['ns_per_frame'] / speed
+            slower = ratio > threshold and ns / speed - base['ns_per_frame'] > min_delta
+            flag = '  !' if slower else ''
+            line += f"{base['ns_per_frame']:>11.1f}{ratio:>7.2f}x{flag}"
+            if slower:
+                regressions.append(key)
+        print(line)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--frames', type=int, default=2000, help='frames per payload mix')
+    parser.add_argument('--repeat', type=int, default=25, help='timed runs per stage (median is kept)')
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='baseline JSON file')
+    parser.add_argument('--save-baseline', action='store_true', help='write results to the baseline file')
+    parser.add_argument('--threshold', type=float, default=1.5,
+                        help='ns/frame ratio vs baseline that counts as a regression')
+    parser.add_argument('--min-delta', type=float, default=100.0,
+                        help='ns/frame a stage must also slow down by to count as a regression')
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            saved = json.load(f)
+        # Different frame counts or repeats change the numbers themselves
+        for key in ('frames', 'repeat', 'seed'):
+            if saved.get(key) != getattr(args, key):
+                print(f"Baseline was recorded with --{key} {saved.get(key)}, not {getattr(args, key)}; "
+                      f"rerun with the same settings or record a new baseline.", file=sys.stderr)
+                return 2
+        if saved.get('python') != sys.version.split()[0]:
+            print(f"warning: baseline was recorded on Python {saved.get('python')}", file=sys.stderr)
+        baseline = saved['results']
+
+    results = run(args.frames, args.repeat, args.seed)
+
+    regressions = report(results, baseline, args.threshold, args.min_delta)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({'python': sys.version.split()[0],
+                       'platform': platform.platform(),
+                       'frames': args.frames,
+                       'repeat': args.repeat,
+                       'seed': args.seed,
+                       'results': results}, f, indent=2)
+            f.write('\n')
+        print(f"\nBaseline saved to {args.baseline}")
+    elif regressions:
+        print(f"\n{len(regressions)} stage(s) slower than {args.threshold:.2f}x baseline")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
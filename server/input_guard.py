@@ -0,0 +1,192 @@
+"""
+Xbox Web Controller — Input Guard
+Wire format, cheap payload checks, per-connection rate limiting and optional
+pairing tokens shared by server_cli.py and server_gui.py.
+"""
+
+import math
+import secrets
+import struct
+import threading
+import time
+
+# ── Wire format ───────────────────────────────────────────────────────────────
+# Binary input frame sent by the web app (see STATE in webapp/app.js):
+# ls.x, ls.y, rs.x, rs.y, lt, rt, button bitmask as little-endian float32.
+FRAME_FORMAT = struct.Struct('<7f')
+BUTTON_ORDER = ['a', 'b', 'x', 'y', 'lb', 'rb', 'view', 'menu', 'home',
+                'dpad-up', 'dpad-down', 'dpad-left', 'dpad-right',
+                'ls-click', 'rs-click']
+
+
+def clamp_axis(value):
+    return -1.0 if value < -1.0 else (1.0 if value > 1.0 else value)
+
+
+def clamp_trigger(value):
+    return 0.0 if value < 0.0 else (1.0 if value > 1.0 else value)
+
+
+def decode_frame(data):
+    """Unpack a binary frame; None if any value is NaN or infinite.
+
+    Sticks are clamped to [-1, 1] and triggers to [0, 1] so out-of-range values
+    cannot wrap around in the gamepad report.
+    """
+    lsx, lsy, rsx, rsy, lt, rt, bits = FRAME_FORMAT.unpack(data)
+    # Any inf/NaN makes the sum non-finite; seven float32 values cannot overflow it
+    if not math.isfinite(lsx + lsy + rsx + rsy + lt + rt + bits):
+        return None
+    return (clamp_axis(lsx), clamp_axis(lsy), clamp_axis(rsx), clamp_axis(rsy),
+            clamp_trigger(lt), clamp_trigger(rt), int(bits))
+
+
+# Largest Socket.IO message the server will read at all. Real input frames are
+# well under 1 KB, so anything bigger is dropped by Engine.IO before decoding.
+MAX_MESSAGE_BYTES = 4096
+
+# Legacy JSON payload: {ls, rs, lt, rt, buttons} with at most one entry per button
+LEGACY_MAX_KEYS = 5
+LEGACY_MAX_BUTTONS = len(BUTTON_ORDER)
+
+# ── Rate limiting ─────────────────────────────────────────────────────────────
+# The web app sends at most one frame per display refresh (60–144 Hz). Each
+# connection gets its own bucket, so a flooding client only ever spends its own
+# budget. Frames over budget are coalesced rather than dropped outright: only the
+# newest one is kept and applied as soon as a token frees up, so a burst after a
+# Wi-Fi stall still ends on the last state the client sent (e.g. a release).
+INPUT_RATE = 150      # sustained frames per second
+INPUT_BURST = 30      # frames allowed back-to-back
+
+
+class TokenBucket:
+    """Per-connection token bucket holding the newest frame that is over budget.
+
+    `lock` guards every field: frames arrive on the connection's thread, while
+    the pending frame is applied by InputGate's flusher thread.
+    """
+
+    __slots__ = ('rate', 'burst', 'tokens', 'last', 'dropped', 'pending', 'lock')
+
+    def __init__(self, rate=INPUT_RATE, burst=INPUT_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.last = time.monotonic()
+        self.dropped = 0          # frames superseded by a newer one before being applied
+        self.pending = None
+        self.lock = threading.Lock()
+
+    def take(self):
+        """Refill, then take one token if there is one."""
+        now = time.monotonic()
+        self.tokens = min(self.tokens + (now - self.last) * self.rate, self.burst)
+        self.last = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+    def wait_time(self):
+        """Seconds until the next token, as of the last take()."""
+        return max(0.0, (1.0 - self.tokens) / self.rate)
+
+
+class InputGate:
+    """Rate-limits input per connection, coalescing frames that are over budget.
+
+    apply(sid, data) is called with the bucket's lock held, so a connection's
+    frames are applied one at a time and in order: within budget on the calling
+    thread, otherwise (newest frame only) on a single background flusher thread.
+    """
+
+    def __init__(self, apply, rate=INPUT_RATE, burst=INPUT_BURST):
+        self.apply = apply
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}        # sid -> TokenBucket
+        self._wake = threading.Event()
+        threading.Thread(target=self._flush, name='input-flusher', daemon=True).start()
+
+    def open(self, sid):
+        self._buckets[sid] = TokenBucket(self.rate, self.burst)
+
+    def close(self, sid):
+        """Forget a connection and discard its pending frame; return its drop count."""
+        bucket = self._buckets.pop(sid, None)
+        if not bucket:
+            return 0
+        with bucket.lock:
+            bucket.pending = None
+            return bucket.dropped
+
+    def submit(self, sid, data):
+        bucket = self._buckets.get(sid)
+        if not bucket:
+            return
+        with bucket.lock:
+            if bucket.pending is not None:
+                bucket.dropped += 1   # superseded by this newer frame
+                bucket.pending = None
+            if bucket.take():
+                self.apply(sid, data)
+                return
+            bucket.pending = data
+        self._wake.set()
+
+    def _flush(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            delay = 0.0
+            while delay is not None:
+                time.sleep(delay)
+                delay = None
+                for sid, bucket in list(self._buckets.items()):
+                    with bucket.lock:
+                        if bucket.pending is None:
+                            continue
+                        if not bucket.take():
+                            wait = bucket.wait_time()
+                            delay = wait if delay is None else min(delay, wait)
+                            continue
+                        data, bucket.pending = bucket.pending, None
+                        try:
+                            self.apply(sid, data)
+                        except Exception:
+                            pass  # keep flushing the other players
+
+
+def payload_ok(data):
+    """Cheap size/shape check, done before any value is decoded."""
+    if type(data) is bytes:
+        return len(data) == FRAME_FORMAT.size
+    if type(data) is dict:
+        if len(data) > LEGACY_MAX_KEYS:
+            return False
+        buttons = data.get('buttons')
+        return not isinstance(buttons, dict) or len(buttons) <= LEGACY_MAX_BUTTONS
+    return False
+
+
+# ── Pairing ───────────────────────────────────────────────────────────────────
+# Optional: when a token is set, it is checked once in the Socket.IO handshake
+# (auth={'token': ...}) and never again per frame.
+
+# Message sent with the refused handshake; webapp/app.js matches on it
+PAIRING_ERROR = 'invalid_pairing_code'
+
+
+def new_pairing_token():
+    """Short random code for the QR link / connect screen."""
+    return secrets.token_urlsafe(6)
+
+
+def pairing_ok(expected, auth):
+    """Check the handshake auth against the pairing token (None = pairing off)."""
+    if not expected:
+        return True
+    token = auth.get('token') if isinstance(auth, dict) else None
+    if not isinstance(token, str):
+        return False
+    return secrets.compare_digest(token.encode(), expected.encode())
@@ -1,10 +1,21 @@
 from flask import Flask, send_from_directory
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO, ConnectionRefusedError, emit
 import vgamepad as vg
 import socket as sock
+import sys
+
+from input_guard import (BUTTON_ORDER, MAX_MESSAGE_BYTES, PAIRING_ERROR,
+                         InputGate, payload_ok, decode_frame, clamp_axis,
+                         clamp_trigger, new_pairing_token, pairing_ok)
 
 app = Flask(__name__, static_folder='../webapp', static_url_path='')
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading', manage_session=False)
+# async_handlers=False: each client's events run in order on its own connection
+# thread, instead of one new thread per event
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading', manage_session=False,
+                    max_http_buffer_size=MAX_MESSAGE_BYTES, async_handlers=False)
+
+# Run with --pair to require the pairing code printed at startup
+PAIRING_TOKEN = new_pairing_token() if '--pair' in sys.argv else None
 
 # ── Gamepad pool (one per connected player, max 4) ──────────────────────────
 MAX_PLAYERS = 4
@@ -30,6 +41,9 @@ BUTTON_MAP = {
     'rs-click':   vg.XUSB_BUTTON.XUSB_GAMEPAD_RIGHT_THUMB,
 }
 
+# (bit mask, button) pairs for the binary frame's button field
+BUTTON_BITS = [(1 << i, BUTTON_MAP[btn]) for i, btn in enumerate(BUTTON_ORDER)]
+
 # ── Static file routes ────────────────────────────────────────────────────────
 
 @app.route('/')
@@ -46,15 +60,19 @@ def service_worker():
 # ── Socket events ─────────────────────────────────────────────────────────────
 
 @socketio.on('connect')
-def on_connect():
+def on_connect(auth=None):
     from flask import request
     sid = request.sid
+    if not pairing_ok(PAIRING_TOKEN, auth):
+        print(f"[!] Rejected connection with wrong pairing code (sid={sid[:8]})")
+        raise ConnectionRefusedError(PAIRING_ERROR)
     if len(gamepads) >= MAX_PLAYERS:
         emit('error', 'Server full – max 4 players')
         return
 
     slot = _player_slots.pop(0)
     gp = vg.VX360Gamepad()
+    input_gate.open(sid)
     gamepads[sid] = gp
     player_ids[sid] = slot
 
@@ -67,6 +85,7 @@ def on_disconnect():
     from flask import request
     sid = request.sid
     if sid in gamepads:
+        dropped = input_gate.close(sid)
         try:
             gp = gamepads.pop(sid)
             gp.reset()
@@ -77,16 +96,40 @@ def on_disconnect():
         if slot:
             _player_slots.insert(0, slot)
             _player_slots.sort()
-        print(f"[-] Player {slot} disconnected (sid={sid[:8]})")
+        dropped = f", {dropped} frames dropped" if dropped else ""
+        print(f"[-] Player {slot} disconnected (sid={sid[:8]}{dropped})")
 
 @socketio.on('input')
 def handle_input(data):
     from flask import request
-    gp = gamepads.get(request.sid)
+    # Shape check and rate limit come before any decoding
+    if payload_ok(data):
+        input_gate.submit(request.sid, data)
+
+def apply_input(sid, data):
+    gp = gamepads.get(sid)
     if not gp:
         return
 
     try:
+        if isinstance(data, bytes):
+            frame = decode_frame(data)
+            if frame is None:
+                return
+            lsx, lsy, rsx, rsy, lt, rt, bits = frame
+            gp.left_joystick_float(x_value_float=lsx, y_value_float=-lsy)
+            gp.right_joystick_float(x_value_float=rsx, y_value_float=-rsy)
+            gp.left_trigger_float(value_float=lt)
+            gp.right_trigger_float(value_float=rt)
+            for mask, button in BUTTON_BITS:
+                if bits & mask:
+                    gp.press_button(button=button)
+                else:
+                    gp.release_button(button=button)
+            gp.update()
+            return
+
+        # Legacy JSON payload from older app builds
         # ─ Joysticks ─
         ls = data.get('ls', {})
         rs = data.get('rs', {})
@@ -94,17 +137,17 @@ def handle_input(data):
         if not isinstance(rs, dict): rs = {}
         
         gp.left_joystick_float(
-            x_value_float=float(ls.get('x', 0)),
-            y_value_float=-float(ls.get('y', 0))
+            x_value_float=clamp_axis(float(ls.get('x', 0))),
+            y_value_float=-clamp_axis(float(ls.get('y', 0)))
         )
         gp.right_joystick_float(
-            x_value_float=float(rs.get('x', 0)),
-            y_value_float=-float(rs.get('y', 0))
+            x_value_float=clamp_axis(float(rs.get('x', 0))),
+            y_value_float=-clamp_axis(float(rs.get('y', 0)))
         )
 
         # ─ Triggers (analog 0.0 – 1.0) ─
-        gp.left_trigger_float(value_float=float(data.get('lt', 0)))
-        gp.right_trigger_float(value_float=float(data.get('rt', 0)))
+        gp.left_trigger_float(value_float=clamp_trigger(float(data.get('lt', 0))))
+        gp.right_trigger_float(value_float=clamp_trigger(float(data.get('rt', 0))))
 
         # ─ Buttons ─
         buttons = data.get('buttons', {})
@@ -117,9 +160,11 @@ def handle_input(data):
                         gp.release_button(button=BUTTON_MAP[btn_id])
 
         gp.update()
-    except (ValueError, TypeError, AttributeError):
+    except (ValueError, TypeError, AttributeError, OverflowError):
         pass  # Ignore malformed payloads
 
+input_gate = InputGate(apply_input)
+
 # ── Entry point ───────────────────────────────────────────────────────────────
 
 if __name__ == '__main__':
@@ -134,6 +179,9 @@ if __name__ == '__main__':
     print("=" * 50)
     print(f"  ➜  Local:   http://localhost:5000")
     print(f"  ➜  Network: http://{local_ip}:5000")
+    if PAIRING_TOKEN:
+        print(f"  ➜  Pairing: http://{local_ip}:5000/?token={PAIRING_TOKEN}")
+        print(f"     (or enter code {PAIRING_TOKEN} on the connect screen)")
     print("  Open the Network URL on your phone!")
     print("=" * 50)
 
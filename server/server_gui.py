@@ -8,6 +8,10 @@ import sys, os, io, threading, socket as sock, logging, queue, time
 import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox
 
+from input_guard import (BUTTON_ORDER, MAX_MESSAGE_BYTES, PAIRING_ERROR,
+                         InputGate, payload_ok, decode_frame, clamp_axis,
+                         clamp_trigger, new_pairing_token, pairing_ok)
+
 # ── Fix for PyInstaller bundled paths ─────────────────────────────────────────
 def resource_path(relative_path):
     """Get absolute path to resource, works for dev and for PyInstaller."""
@@ -68,11 +72,12 @@ def get_local_ip():
 
 # ── Server Thread ─────────────────────────────────────────────────────────────
 class ServerThread(threading.Thread):
-    def __init__(self, host, port, log_callback):
+    def __init__(self, host, port, log_callback, pairing_token=None):
         super().__init__(daemon=True)
         self.host = host
         self.port = port
         self.log = log_callback
+        self.pairing_token = pairing_token
         self.socketio = None
         self.running = False
 
@@ -81,7 +86,7 @@ class ServerThread(threading.Thread):
         try:
             # Import server components
             from flask import Flask, send_from_directory, request as flask_request
-            from flask_socketio import SocketIO, emit
+            from flask_socketio import SocketIO, ConnectionRefusedError, emit
             import vgamepad as vg
 
             public_dir = resource_path('../webapp')
@@ -93,8 +98,11 @@ class ServerThread(threading.Thread):
             wlog = logging.getLogger('werkzeug')
             wlog.setLevel(logging.ERROR)
 
+            # Handle each client's events in order on its connection thread
+            # (no new thread per event)
             socketio = SocketIO(app, cors_allowed_origins="*",
-                                async_mode='threading', manage_session=False)
+                                async_mode='threading', manage_session=False,
+                                max_http_buffer_size=MAX_MESSAGE_BYTES, async_handlers=False)
             self.socketio = socketio
 
             # Gamepad pool
@@ -121,6 +129,9 @@ class ServerThread(threading.Thread):
                 'rs-click':   vg.XUSB_BUTTON.XUSB_GAMEPAD_RIGHT_THUMB,
             }
 
+            # (bit mask, button) pairs for the binary frame's button field
+            BUTTON_BITS = [(1 << i, BUTTON_MAP[btn]) for i, btn in enumerate(BUTTON_ORDER)]
+
             @app.route('/')
             def website_index():
                 return send_from_directory(website_dir, 'index.html')
@@ -150,13 +161,17 @@ class ServerThread(threading.Thread):
                 return send_from_directory(apk_dir, 'app-debug.apk', as_attachment=True, download_name='XboxController.apk')
 
             @socketio.on('connect')
-            def on_connect():
+            def on_connect(auth=None):
                 sid = flask_request.sid
+                if not pairing_ok(self.pairing_token, auth):
+                    self.log("[WARNING] Rejected connection with wrong pairing code")
+                    raise ConnectionRefusedError(PAIRING_ERROR)
                 if len(gamepads) >= MAX_PLAYERS:
                     emit('error', 'Server full – max 4 players')
                     return
                 slot = _player_slots.pop(0)
                 gp = vg.VX360Gamepad()
+                input_gate.open(sid)
                 gamepads[sid] = gp
                 player_ids[sid] = slot
                 gp.update()
@@ -167,6 +182,7 @@ class ServerThread(threading.Thread):
             def on_disconnect():
                 sid = flask_request.sid
                 if sid in gamepads:
+                    dropped = input_gate.close(sid)
                     try:
                         gp = gamepads.pop(sid)
                         gp.reset()
@@ -177,29 +193,53 @@ class ServerThread(threading.Thread):
                     if slot:
                         _player_slots.insert(0, slot)
                         _player_slots.sort()
-                    self.log(f"[-] Player {slot} disconnected")
+                    dropped = f" ({dropped} frames dropped)" if dropped else ""
+                    self.log(f"[-] Player {slot} disconnected{dropped}")
 
             @socketio.on('input')
             def handle_input(data):
-                gp = gamepads.get(flask_request.sid)
+                # Shape check and rate limit come before any decoding
+                if payload_ok(data):
+                    input_gate.submit(flask_request.sid, data)
+
+            def apply_input(sid, data):
+                gp = gamepads.get(sid)
                 if not gp:
                     return
                 try:
+                    if isinstance(data, bytes):
+                        frame = decode_frame(data)
+                        if frame is None:
+                            return
+                        lsx, lsy, rsx, rsy, lt, rt, bits = frame
+                        gp.left_joystick_float(x_value_float=lsx, y_value_float=-lsy)
+                        gp.right_joystick_float(x_value_float=rsx, y_value_float=-rsy)
+                        gp.left_trigger_float(value_float=lt)
+                        gp.right_trigger_float(value_float=rt)
+                        for mask, button in BUTTON_BITS:
+                            if bits & mask:
+                                gp.press_button(button=button)
+                            else:
+                                gp.release_button(button=button)
+                        gp.update()
+                        return
+
+                    # Legacy JSON payload from older app builds
                     ls = data.get('ls', {})
                     rs = data.get('rs', {})
                     if not isinstance(ls, dict): ls = {}
                     if not isinstance(rs, dict): rs = {}
                     
                     gp.left_joystick_float(
-                        x_value_float=float(ls.get('x', 0)),
-                        y_value_float=-float(ls.get('y', 0))
+                        x_value_float=clamp_axis(float(ls.get('x', 0))),
+                        y_value_float=-clamp_axis(float(ls.get('y', 0)))
                     )
                     gp.right_joystick_float(
-                        x_value_float=float(rs.get('x', 0)),
-                        y_value_float=-float(rs.get('y', 0))
+                        x_value_float=clamp_axis(float(rs.get('x', 0))),
+                        y_value_float=-clamp_axis(float(rs.get('y', 0)))
                     )
-                    gp.left_trigger_float(value_float=float(data.get('lt', 0)))
-                    gp.right_trigger_float(value_float=float(data.get('rt', 0)))
+                    gp.left_trigger_float(value_float=clamp_trigger(float(data.get('lt', 0))))
+                    gp.right_trigger_float(value_float=clamp_trigger(float(data.get('rt', 0))))
                     buttons = data.get('buttons', {})
                     if isinstance(buttons, dict):
                         for btn_id, pressed in buttons.items():
@@ -209,9 +249,11 @@ class ServerThread(threading.Thread):
                                 else:
                                     gp.release_button(button=BUTTON_MAP[btn_id])
                     gp.update()
-                except (ValueError, TypeError, AttributeError):
+                except (ValueError, TypeError, AttributeError, OverflowError):
                     pass # Ignore malformed payloads
 
+            input_gate = InputGate(apply_input)
+
             self.log(f"Server started on http://{self.host}:{self.port}")
             socketio.run(app, host='0.0.0.0', port=self.port,
                          debug=False, use_reloader=False, log_output=False, allow_unsafe_werkzeug=True)
@@ -247,6 +289,7 @@ class ControllerServerApp:
         self.server_thread = None
         self.local_ip = get_local_ip()
         self.port = 5000
+        self.pairing_token = None
         self.qr_image = None
 
         self._build_ui()
@@ -317,6 +360,16 @@ class ControllerServerApp:
                                     highlightthickness=1)
         self.port_entry.pack(fill=tk.X, pady=2)
 
+        # Optional pairing code (embedded in the QR link)
+        self.pair_var = tk.BooleanVar(value=False)
+        self.pair_check = tk.Checkbutton(port_frame, text="Require pairing code",
+                                         variable=self.pair_var, font=("Segoe UI", 8),
+                                         bg=self.BG_CARD, fg=self.TEXT_DIM,
+                                         activebackground=self.BG_CARD,
+                                         activeforeground=self.TEXT,
+                                         selectcolor=self.BG_INPUT, anchor="w")
+        self.pair_check.pack(fill=tk.X, pady=(4, 0))
+
         # Copy URL button
         self.copy_btn = tk.Button(left_card, text="📋 Copy URL",
                                    font=self.FONT_BOLD, bg="#2a2a4a",
@@ -444,9 +497,14 @@ class ControllerServerApp:
         self.start_btn.config(text="●  Server Running", bg="#2a2a4a",
                                state=tk.DISABLED)
         self.port_entry.config(state=tk.DISABLED)
+        self.pair_check.config(state=tk.DISABLED)
+
+        self.pairing_token = new_pairing_token() if self.pair_var.get() else None
+        if self.pairing_token:
+            self._log_message(f"[INFO] Pairing code: {self.pairing_token}")
 
         # Generate QR code
-        url = f"http://{self.local_ip}:{self.port}"
+        url = self._server_url()
         qr_img = generate_qr_image(url)
         if qr_img:
             self.qr_image = qr_img  # Keep reference
@@ -456,7 +514,7 @@ class ControllerServerApp:
 
         # Start server thread
         self.server_thread = ServerThread(
-            self.local_ip, self.port, self._log_message
+            self.local_ip, self.port, self._log_message, self.pairing_token
         )
         self.server_thread.start()
 
@@ -492,8 +550,14 @@ class ControllerServerApp:
 
         self.root.after(150, self._poll_logs)
 
-    def _copy_url(self):
+    def _server_url(self):
         url = f"http://{self.local_ip}:{self.port_var.get()}"
+        if self.pairing_token:
+            url += f"/?token={self.pairing_token}"
+        return url
+
+    def _copy_url(self):
+        url = self._server_url()
         self.root.clipboard_clear()
         self.root.clipboard_append(url)
         self.copy_btn.config(text="✅ Copied!")
@@ -4,6 +4,7 @@ let socket = null;
 const connectOverlay = document.getElementById('connect-overlay');
 const serverIpInput = document.getElementById('server-ip');
 const serverPortInput = document.getElementById('server-port');
+const pairingCodeInput = document.getElementById('pairing-code');
 const connectBtn = document.getElementById('connect-btn');
 const connectBtnText = connectBtn.querySelector('.connect-btn-text');
 const connectBtnSpinner = connectBtn.querySelector('.connect-btn-spinner');
@@ -16,6 +17,11 @@ const savedPort = localStorage.getItem('xbox_server_port') || '5000';
 serverIpInput.value = savedIp;
 serverPortInput.value = savedPort;
 
+// Pairing code from the server's QR link (?token=...) wins over the saved one
+const urlToken = new URLSearchParams(location.search).get('token');
+if (urlToken) localStorage.setItem('xbox_pairing_code', urlToken);
+pairingCodeInput.value = localStorage.getItem('xbox_pairing_code') || '';
+
 function showConnectOverlay() {
     connectOverlay.classList.add('visible');
     connectError.textContent = '';
@@ -26,10 +32,11 @@ function hideConnectOverlay() {
     connectOverlay.classList.remove('visible');
 }
 
-function connectToServer(ip, port) {
+function connectToServer(ip, port, code) {
     // Save settings
     localStorage.setItem('xbox_server_ip', ip);
     localStorage.setItem('xbox_server_port', port);
+    localStorage.setItem('xbox_pairing_code', code);
 
     // Show loading state
     connectBtnText.textContent = 'Connecting…';
@@ -47,6 +54,8 @@ function connectToServer(ip, port) {
         timeout: 5000,
         reconnectionAttempts: 3,
         reconnectionDelay: 1000,
+        // Only checked once, in the handshake
+        auth: { token: code },
     });
 
     socket.on('connect', () => {
@@ -63,7 +72,9 @@ function connectToServer(ip, port) {
     });
 
     socket.on('connect_error', (err) => {
-        connectError.textContent = `Cannot reach ${ip}:${port}. Is the server running?`;
+        connectError.textContent = err.message === 'invalid_pairing_code'
+            ? 'Wrong or missing pairing code. Scan the QR code on your PC again.'
+            : `Cannot reach ${ip}:${port}. Is the server running?`;
         resetConnectBtn();
         showConnectOverlay();
     });
@@ -83,12 +94,13 @@ function resetConnectBtn() {
 connectBtn.addEventListener('click', () => {
     const ip = serverIpInput.value.trim();
     const port = serverPortInput.value.trim() || '5000';
+    const code = pairingCodeInput.value.trim();
     if (!ip) {
         connectError.textContent = 'Please enter an IP address';
         serverIpInput.focus();
         return;
     }
-    connectToServer(ip, port);
+    connectToServer(ip, port, code);
 });
 
 // Enter key in inputs
@@ -98,6 +110,9 @@ serverIpInput.addEventListener('keydown', (e) => {
 serverPortInput.addEventListener('keydown', (e) => {
     if (e.key === 'Enter') connectBtn.click();
 });
+pairingCodeInput.addEventListener('keydown', (e) => {
+    if (e.key === 'Enter') connectBtn.click();
+});
 
 // Settings gear opens overlay
 settingsBtn.addEventListener('click', (e) => {
@@ -110,29 +125,23 @@ settingsBtn.addEventListener('click', (e) => {
 
 // Auto-connect if we have a saved IP, otherwise show overlay
 if (savedIp) {
-    connectToServer(savedIp, savedPort);
+    connectToServer(savedIp, savedPort, pairingCodeInput.value);
 } else {
     showConnectOverlay();
 }
 
 // ====== STATE ======
-const state = {
-    ls: { x: 0, y: 0 },
-    rs: { x: 0, y: 0 },
-    buttons: {},
-    lt: 0,
-    rt: 0,
-};
-
-let sendScheduled = false;
-function scheduleEmit() {
-    if (sendScheduled || !socket || !socket.connected) return;
-    sendScheduled = true;
-    requestAnimationFrame(() => {
-        socket.emit('input', state);
-        sendScheduled = false;
-    });
-}
+// One preallocated frame, sent to the server as-is (binary, little-endian float32):
+//   [ls.x, ls.y, rs.x, rs.y, lt, rt, button bitmask]
+// Keep this layout and BUTTON_ORDER in sync with FRAME_FORMAT / BUTTON_ORDER on the server.
+const LS_X = 0, RS_X = 2, LT = 4, RT = 5, BUTTONS = 6;
+const state = new Float32Array(7);
+
+const BUTTON_ORDER = [
+    'a', 'b', 'x', 'y', 'lb', 'rb', 'view', 'menu', 'home',
+    'dpad-up', 'dpad-down', 'dpad-left', 'dpad-right', 'ls-click', 'rs-click',
+];
+let buttonBits = 0;
 
 // ====== STATUS ======
 const statusDot = document.getElementById('status-dot');
@@ -142,6 +151,140 @@ const playerBadge = document.getElementById('player-badge');
 // ====== EDIT MODE FLAG (used by editor.js) ======
 window.isEditMode = false;
 
+// ====== CONTROL GEOMETRY CACHE ======
+// getBoundingClientRect() forces a layout, so control rects are read once and
+// reused until something moves the controls (resize, preset switch, edit mode).
+let geometryVersion = 0;
+
+function controlRect(el) {
+    if (el._rectVersion !== geometryVersion) {
+        el._rect = el.getBoundingClientRect();
+        el._rectVersion = geometryVersion;
+    }
+    return el._rect;
+}
+
+function invalidateControlGeometry() {
+    geometryVersion++;
+}
+
+window.invalidateControlGeometry = invalidateControlGeometry;
+window.addEventListener('resize', invalidateControlGeometry);
+window.addEventListener('orientationchange', invalidateControlGeometry);
+
+// ====== PERF READOUT (open the page with ?perf) ======
+// Shows average/worst frame time of the input loop and event-to-send latency.
+const perfEnabled = new URLSearchParams(location.search).has('perf');
+let perfEl = null;
+let perfLastReport = 0;
+let perfFrames = 0, perfFrameSum = 0, perfFrameMax = 0;
+let perfSends = 0, perfLatencySum = 0, perfLatencyMax = 0;
+
+function recordSend(latency) {
+    perfSends++;
+    perfLatencySum += latency;
+    if (latency > perfLatencyMax) perfLatencyMax = latency;
+}
+
+function recordFrame(now, frameTime) {
+    perfFrames++;
+    perfFrameSum += frameTime;
+    if (frameTime > perfFrameMax) perfFrameMax = frameTime;
+    if (now - perfLastReport < 500) return;
+
+    const frameAvg = perfFrameSum / perfFrames;
+    const sendAvg = perfSends ? perfLatencySum / perfSends : 0;
+    perfEl.textContent =
+        `frame ${frameAvg.toFixed(1)}/${perfFrameMax.toFixed(1)}ms · ` +
+        `send ${sendAvg.toFixed(1)}/${perfLatencyMax.toFixed(1)}ms`;
+
+    perfLastReport = now;
+    perfFrames = perfFrameSum = perfFrameMax = 0;
+    perfSends = perfLatencySum = perfLatencyMax = 0;
+}
+
+if (perfEnabled) {
+    perfEl = document.createElement('span');
+    perfEl.id = 'perf-readout';
+    document.getElementById('status-bar').insertBefore(perfEl, settingsBtn);
+}
+
+// ====== INPUT LOOP ======
+// A single requestAnimationFrame loop advances every trigger ramp and sends at
+// most one frame per display refresh. It only keeps running while something is
+// animating (or the perf readout is on).
+const triggers = [];
+const RAMP_PER_MS = 0.07 / 16;   // same speed as the old 0.07-per-16ms ramp
+
+let dirty = false;
+let pendingSince = 0;            // timestamp of the oldest unsent input event
+let loopRunning = false;
+let lastFrameTime = 0;
+
+function markDirty(timeStamp) {
+    dirty = true;
+    if (!pendingSince) pendingSince = timeStamp;
+    requestTick();
+}
+
+function requestTick() {
+    if (loopRunning) return;
+    loopRunning = true;
+    lastFrameTime = 0;
+    requestAnimationFrame(tick);
+}
+
+function stepTrigger(t, dt) {
+    if (t.value === t.target) return false;
+    t.value = t.target === 1
+        ? Math.min(1, t.value + RAMP_PER_MS * dt)
+        : Math.max(0, t.value - RAMP_PER_MS * dt);
+    t.fill.style.transform = `scaleY(${t.value})`;
+    state[t.index] = t.value;
+    dirty = true;
+    return t.value !== t.target;
+}
+
+// Engine.IO keeps queued packets by reference until the transport is writable
+// again (long-polling, or mid-upgrade). Sending `state` itself then would let a
+// later change overwrite a frame still in the queue, so a press and release in
+// that window would both go out as "released". Copy unless it is sent right away.
+function frameToSend() {
+    const engine = socket.io.engine;
+    const sendsNow = engine && engine.readyState === 'open' && engine.transport.writable
+        && !engine.upgrading && engine.writeBuffer.length === 0;
+    return sendsNow ? state : state.slice();
+}
+
+function tick(now) {
+    const frameTime = lastFrameTime ? now - lastFrameTime : 0;
+    lastFrameTime = now;
+
+    let ramping = false;
+    for (let i = 0; i < triggers.length; i++) {
+        if (stepTrigger(triggers[i], frameTime || 16)) ramping = true;
+    }
+
+    if (dirty) {
+        if (socket && socket.connected) {
+            socket.emit('input', frameToSend());
+            if (perfEnabled && pendingSince) recordSend(performance.now() - pendingSince);
+        }
+        dirty = false;
+        pendingSince = 0;
+    }
+
+    if (perfEnabled && frameTime) recordFrame(now, frameTime);
+
+    if (ramping || perfEnabled) {
+        requestAnimationFrame(tick);
+    } else {
+        loopRunning = false;
+    }
+}
+
+if (perfEnabled) requestTick();
+
 // ====== HAPTIC VIBRATION ======
 function vibrate(pattern = 30) {
     if (navigator.vibrate) {
@@ -149,27 +292,28 @@ function vibrate(pattern = 30) {
     }
 }
 
-function pulseRipple(el, e) {
-    const r = document.createElement('span');
-    r.className = 'ripple';
-
-    // Position ripple at touch point or center
-    if (e && e.changedTouches && e.changedTouches[0]) {
-        const rect = el.getBoundingClientRect();
-        const x = e.changedTouches[0].clientX - rect.left;
-        const y = e.changedTouches[0].clientY - rect.top;
-        r.style.left = x + 'px';
-        r.style.top = y + 'px';
-    } else if (e && e.clientX !== undefined) {
-        const rect = el.getBoundingClientRect();
-        const x = e.clientX - rect.left;
-        const y = e.clientY - rect.top;
-        r.style.left = x + 'px';
-        r.style.top = y + 'px';
+// Each control owns one ripple node, created on first press and replayed with
+// the Web Animations API instead of appending/removing a node per press.
+const RIPPLE_KEYFRAMES = [
+    { transform: 'scale(0)', opacity: 0.6 },
+    { transform: 'scale(3)', opacity: 0 },
+];
+const RIPPLE_TIMING = { duration: 400, easing: 'ease-out' };
+
+function pulseRipple(el, clientX, clientY) {
+    let r = el._ripple;
+    if (!r) {
+        r = document.createElement('span');
+        r.className = 'ripple';
+        el.appendChild(r);
+        el._ripple = r;
     }
 
-    el.appendChild(r);
-    r.addEventListener('animationend', () => r.remove());
+    // Position ripple at the touch point
+    const rect = controlRect(el);
+    r.style.left = (clientX - rect.left) + 'px';
+    r.style.top = (clientY - rect.top) + 'px';
+    r.animate(RIPPLE_KEYFRAMES, RIPPLE_TIMING);
 }
 
 // Unlock haptics on first touch
@@ -185,180 +329,147 @@ window.addEventListener('touchstart', unlockHaptics, { once: true });
 window.addEventListener('mousedown', unlockHaptics, { once: true });
 
 // ====== GENERIC BUTTON HANDLER ======
-function setupButton(el, stateKey) {
+// Pointer Events cover touch, mouse and pen. Nothing is prevented in edit mode
+// so editor.js still receives its touch/mouse events.
+function setupButton(el, id) {
+    const bit = 1 << BUTTON_ORDER.indexOf(id);
+    // Distinct haptics for system buttons
+    const haptic = id === 'home' ? [40, 30, 40]
+        : (id === 'menu' || id === 'view') ? 45
+            : 20;
+    let activePointer = null;
+
     const onDown = (e) => {
+        if (window.isEditMode || activePointer !== null) return;
         e.preventDefault();
-        if (window.isEditMode) return; // Disable in edit mode
-        if (state.buttons[stateKey]) return;
-        state.buttons[stateKey] = true;
+        activePointer = e.pointerId;
+        buttonBits |= bit;
+        state[BUTTONS] = buttonBits;
         el.classList.add('active');
-
-        // Distinct haptics for system buttons
-        if (['home', 'menu', 'view'].includes(stateKey)) {
-            vibrate(stateKey === 'home' ? [40, 30, 40] : 45);
-        } else {
-            vibrate(20);
-        }
-
-        pulseRipple(el, e);
-        scheduleEmit();
+        vibrate(haptic);
+        pulseRipple(el, e.clientX, e.clientY);
+        markDirty(e.timeStamp);
     };
     const onUp = (e) => {
-        e.preventDefault();
-        if (window.isEditMode) return;
-        if (!state.buttons[stateKey]) return;
-        state.buttons[stateKey] = false;
+        if (e.pointerId !== activePointer) return;
+        activePointer = null;
+        buttonBits &= ~bit;
+        state[BUTTONS] = buttonBits;
         el.classList.remove('active');
-        scheduleEmit();
+        markDirty(e.timeStamp);
     };
 
-    el.addEventListener('touchstart', onDown, { passive: false });
-    el.addEventListener('touchend', onUp, { passive: false });
-    el.addEventListener('touchcancel', onUp, { passive: false });
-    // mouse fallback for desktop testing
-    el.addEventListener('mousedown', onDown, { passive: false });
-    el.addEventListener('mouseup', onUp, { passive: false });
-    el.addEventListener('mouseleave', onUp, { passive: false });
+    el.addEventListener('pointerdown', onDown);
+    el.addEventListener('pointerup', onUp);
+    el.addEventListener('pointercancel', onUp);
+    el.addEventListener('pointerleave', onUp);
 }
 
 // Register all face/dpad/sys buttons
-['a', 'b', 'x', 'y',
-    'dpad-up', 'dpad-down', 'dpad-left', 'dpad-right',
-    'lb', 'rb', 'view', 'menu', 'home',
-    'ls-click', 'rs-click'].forEach(id => {
-        const el = document.getElementById(id);
-        if (el) setupButton(el, id);
-    });
+BUTTON_ORDER.forEach(id => {
+    const el = document.getElementById(id);
+    if (el) setupButton(el, id);
+});
 
 // ====== ANALOG TRIGGERS (hold = analog fill) ======
-function setupTrigger(id, stateKey, fillId) {
+function setupTrigger(id, stateIndex, fillId) {
     const el = document.getElementById(id);
-    const fill = document.getElementById(fillId);
-
-    let interval = null;
-    let value = 0;
-
-    const ramp = (target) => {
-        clearInterval(interval);
-        interval = setInterval(() => {
-            value = target === 1
-                ? Math.min(1, value + 0.07)
-                : Math.max(0, value - 0.07);
-            fill.style.height = (value * 100) + '%';
-            state[stateKey] = value;
-            scheduleEmit();
-            if (value === target) clearInterval(interval);
-        }, 16);
-    };
+    const trigger = { fill: document.getElementById(fillId), index: stateIndex, value: 0, target: 0 };
+    triggers.push(trigger);
+    let activePointer = null;
 
     const onDown = (e) => {
+        if (window.isEditMode || activePointer !== null) return;
         e.preventDefault();
-        if (window.isEditMode) return;
+        activePointer = e.pointerId;
         el.classList.add('active');
         vibrate(15);
-        pulseRipple(el, e);
-        ramp(1);
+        pulseRipple(el, e.clientX, e.clientY);
+        trigger.target = 1;
+        markDirty(e.timeStamp);
     };
     const onUp = (e) => {
-        e.preventDefault();
-        if (window.isEditMode) return;
+        if (e.pointerId !== activePointer) return;
+        activePointer = null;
         el.classList.remove('active');
-        ramp(0);
+        trigger.target = 0;
+        markDirty(e.timeStamp);
     };
 
-    el.addEventListener('touchstart', onDown, { passive: false });
-    el.addEventListener('touchend', onUp, { passive: false });
-    el.addEventListener('touchcancel', onUp, { passive: false });
-    el.addEventListener('mousedown', onDown, { passive: false });
-    el.addEventListener('mouseup', onUp, { passive: false });
-    el.addEventListener('mouseleave', onUp, { passive: false });
+    el.addEventListener('pointerdown', onDown);
+    el.addEventListener('pointerup', onUp);
+    el.addEventListener('pointercancel', onUp);
+    el.addEventListener('pointerleave', onUp);
 }
 
-setupTrigger('lt', 'lt', 'lt-fill');
-setupTrigger('rt', 'rt', 'rt-fill');
+setupTrigger('lt', LT, 'lt-fill');
+setupTrigger('rt', RT, 'rt-fill');
 
 // ====== JOYSTICK ======
-function setupJoystick(wrapperId, stickId, stateKey) {
+function setupJoystick(wrapperId, stickId, xIndex) {
     const wrapper = document.getElementById(wrapperId);
     const stick = document.getElementById(stickId);
-    let activeTouch = null;
-
-    const getCenter = () => {
-        const r = wrapper.getBoundingClientRect();
-        return { cx: r.left + r.width / 2, cy: r.top + r.height / 2, maxDist: r.width * 0.4 };
-    };
+    let activePointer = null;
 
     const move = (clientX, clientY) => {
-        const { cx, cy, maxDist } = getCenter();
-        let dx = clientX - cx;
-        let dy = clientY - cy;
+        const r = controlRect(wrapper);
+        const maxDist = r.width * 0.4;
+        let dx = clientX - (r.left + r.width / 2);
+        let dy = clientY - (r.top + r.height / 2);
         const dist = Math.sqrt(dx * dx + dy * dy);
         if (dist > maxDist) {
             dx *= maxDist / dist;
             dy *= maxDist / dist;
         }
         stick.style.transform = `translate(calc(-50% + ${dx}px), calc(-50% + ${dy}px))`;
-        state[stateKey] = { x: dx / maxDist, y: dy / maxDist };
-        scheduleEmit();
+        state[xIndex] = dx / maxDist;
+        state[xIndex + 1] = dy / maxDist;
     };
 
-    const reset = () => {
+    const reset = (timeStamp) => {
         stick.style.transform = 'translate(-50%, -50%)';
-        state[stateKey] = { x: 0, y: 0 };
+        state[xIndex] = 0;
+        state[xIndex + 1] = 0;
         wrapper.classList.remove('active');
-        activeTouch = null;
-        scheduleEmit();
+        activePointer = null;
+        markDirty(timeStamp);
     };
 
-    wrapper.addEventListener('touchstart', (e) => {
+    wrapper.addEventListener('pointerdown', (e) => {
+        if (window.isEditMode || activePointer !== null) return;
         e.preventDefault();
-        if (window.isEditMode) return;
-        if (activeTouch !== null) return;
-        activeTouch = e.changedTouches[0].identifier;
+        activePointer = e.pointerId;
+        wrapper.setPointerCapture(e.pointerId);
         wrapper.classList.add('active');
         vibrate(10);
-        move(e.changedTouches[0].clientX, e.changedTouches[0].clientY);
-    }, { passive: false });
-
-    wrapper.addEventListener('touchmove', (e) => {
-        e.preventDefault();
-        if (window.isEditMode) return;
-        for (const t of e.changedTouches) {
-            if (t.identifier === activeTouch) {
-                move(t.clientX, t.clientY);
-                break;
-            }
-        }
-    }, { passive: false });
-
-    wrapper.addEventListener('touchend', (e) => {
-        e.preventDefault();
-        if (window.isEditMode) return;
-        for (const t of e.changedTouches) {
-            if (t.identifier === activeTouch) { reset(); break; }
-        }
-    }, { passive: false });
-
-    wrapper.addEventListener('touchcancel', () => { if (!window.isEditMode) reset(); }, { passive: false });
-
-    // Mouse fallback
-    let mouseDown = false;
-    wrapper.addEventListener('mousedown', (e) => {
-        if (window.isEditMode) return;
-        mouseDown = true;
-        wrapper.classList.add('active');
         move(e.clientX, e.clientY);
+        markDirty(e.timeStamp);
     });
-    window.addEventListener('mousemove', (e) => {
-        if (mouseDown && !window.isEditMode) move(e.clientX, e.clientY);
-    });
-    window.addEventListener('mouseup', () => {
-        if (mouseDown) { mouseDown = false; reset(); }
+
+    wrapper.addEventListener('pointermove', (e) => {
+        if (e.pointerId !== activePointer) return;
+        // Moves between two frames arrive as one event: the last coalesced
+        // sample is the freshest position, the first is when the input began.
+        const samples = e.getCoalescedEvents ? e.getCoalescedEvents() : null;
+        if (samples && samples.length) {
+            const last = samples[samples.length - 1];
+            move(last.clientX, last.clientY);
+            markDirty(samples[0].timeStamp);
+        } else {
+            move(e.clientX, e.clientY);
+            markDirty(e.timeStamp);
+        }
     });
+
+    const onUp = (e) => {
+        if (e.pointerId === activePointer) reset(e.timeStamp);
+    };
+    wrapper.addEventListener('pointerup', onUp);
+    wrapper.addEventListener('pointercancel', onUp);
 }
 
-setupJoystick('ls', 'ls-stick', 'ls');
-setupJoystick('rs', 'rs-stick', 'rs');
+setupJoystick('ls', 'ls-stick', LS_X);
+setupJoystick('rs', 'rs-stick', RS_X);
 
 // ====== PREVENT ALL DEFAULT BROWSER GESTURES ======
 document.addEventListener('gesturestart', e => e.preventDefault());
@@ -366,4 +477,4 @@ document.addEventListener('contextmenu', e => e.preventDefault());
 document.addEventListener('touchmove', e => {
     if (e.target.closest('.joystick, .trigger-btn, .connect-card')) return;
     e.preventDefault();
-}, { passive: false });
\ No newline at end of file
+}, { passive: false });
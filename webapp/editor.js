@@ -128,6 +128,8 @@
         });
 
         saveCustomLayout();
+        // Controls may have moved; app.js re-reads their rects on the next press
+        if (window.invalidateControlGeometry) window.invalidateControlGeometry();
         if (navigator.vibrate) navigator.vibrate(15);
     }
 
@@ -319,5 +321,6 @@
     loadCustomLayout();
     applyCustomLayout();
     addEditButton();
+    if (window.invalidateControlGeometry) window.invalidateControlGeometry();
 
 })();
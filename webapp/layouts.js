@@ -121,6 +121,9 @@ function applyPreset(presetName) {
 
     localStorage.setItem('xbox_layout_preset', presetName);
 
+    // Controls may have moved; app.js re-reads their rects on the next press
+    if (window.invalidateControlGeometry) window.invalidateControlGeometry();
+
     // Update toggle button label
     const toggleLabel = document.getElementById('layout-toggle-label');
     if (toggleLabel) {
@@ -1,4 +1,4 @@
-const CACHE = 'xbox-ctrl-v1';
+const CACHE = 'xbox-ctrl-v4';
 const ASSETS = ['/', '/style.css', '/app.js', '/manifest.json'];
 
 self.addEventListener('install', e => {